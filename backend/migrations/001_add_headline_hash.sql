@@ -0,0 +1,25 @@
+-- =================================================================
+-- Migration 001: Unique headline hash for duplicate prevention
+-- =================================================================
+-- Adds a md5 hash of the headline with a unique index so the scraper
+-- can upsert with ON CONFLICT DO NOTHING instead of checking for
+-- existing headlines before every insert.
+
+ALTER TABLE sentiment_analysis ADD COLUMN IF NOT EXISTS headline_hash TEXT;
+
+-- Backfill existing rows (matches hashlib.md5(headline.encode()) in Python)
+UPDATE sentiment_analysis
+SET headline_hash = md5(headline)
+WHERE headline_hash IS NULL;
+
+-- Permanently delete later (newer) duplicate rows so the unique index can
+-- be built; only the earliest scrape of each headline is kept
+DELETE FROM sentiment_analysis a
+USING sentiment_analysis b
+WHERE a.headline_hash = b.headline_hash
+  AND (a.scraped_at, a.id) > (b.scraped_at, b.id);
+
+ALTER TABLE sentiment_analysis ALTER COLUMN headline_hash SET NOT NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sentiment_headline_hash
+ON sentiment_analysis(headline_hash);
@@ -0,0 +1,30 @@
+-- =================================================================
+-- Migration 002: Server-side sentiment summary aggregation
+-- =================================================================
+-- Returns counts, average and most extreme headlines for a time range
+-- as a single JSON object, so the backend doesn't pull every row.
+
+CREATE OR REPLACE FUNCTION sentiment_summary(start_time TIMESTAMPTZ, end_time TIMESTAMPTZ DEFAULT NOW())
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'total_headlines', COUNT(*),
+        'positive_count', COUNT(*) FILTER (WHERE classification = 'positive'),
+        'negative_count', COUNT(*) FILTER (WHERE classification = 'negative'),
+        'neutral_count', COUNT(*) FILTER (WHERE classification = 'neutral'),
+        'avg_sentiment', AVG(sentiment_compound),
+        'most_positive_headline', (
+            SELECT headline FROM sentiment_analysis
+            WHERE scraped_at >= start_time AND scraped_at <= end_time
+            ORDER BY sentiment_compound DESC LIMIT 1
+        ),
+        'most_positive_score', MAX(sentiment_compound),
+        'most_negative_headline', (
+            SELECT headline FROM sentiment_analysis
+            WHERE scraped_at >= start_time AND scraped_at <= end_time
+            ORDER BY sentiment_compound ASC LIMIT 1
+        ),
+        'most_negative_score', MIN(sentiment_compound)
+    )
+    FROM sentiment_analysis
+    WHERE scraped_at >= start_time AND scraped_at <= end_time;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,82 @@
+-- =================================================================
+-- Migration 003: Index time-bounded sentiment queries
+-- =================================================================
+-- Composite index so range-filtered aggregates and extremes use a range
+-- scan on scraped_at instead of a full table scan. Rows in the range are
+-- still read and sorted by sentiment_compound; the index does not make
+-- ORDER BY sentiment_compound LIMIT 1 a direct lookup.
+
+CREATE INDEX IF NOT EXISTS idx_sentiment_scraped_at_compound
+ON sentiment_analysis(scraped_at, sentiment_compound);
+
+-- Filter on a scraped_at range instead of DATE(scraped_at) so the
+-- indexes above can be used
+CREATE OR REPLACE FUNCTION generate_daily_summary(target_date DATE DEFAULT CURRENT_DATE)
+RETURNS BOOLEAN AS $$
+DECLARE
+    summary_exists BOOLEAN;
+    total_count INTEGER;
+    pos_count INTEGER;
+    neg_count INTEGER;
+    neu_count INTEGER;
+    avg_sent DECIMAL(6,4);
+    most_pos_headline TEXT;
+    most_neg_headline TEXT;
+    most_pos_score DECIMAL(6,4);
+    most_neg_score DECIMAL(6,4);
+BEGIN
+    -- Check if summary already exists
+    SELECT EXISTS(SELECT 1 FROM daily_summaries WHERE date = target_date) INTO summary_exists;
+    
+    IF summary_exists THEN
+        RAISE NOTICE 'Daily summary for % already exists', target_date;
+        RETURN FALSE;
+    END IF;
+    
+    -- Get aggregated data for the day
+    SELECT 
+        COUNT(*),
+        COUNT(*) FILTER (WHERE classification = 'positive'),
+        COUNT(*) FILTER (WHERE classification = 'negative'),
+        COUNT(*) FILTER (WHERE classification = 'neutral'),
+        AVG(sentiment_compound)
+    INTO total_count, pos_count, neg_count, neu_count, avg_sent
+    FROM sentiment_analysis 
+    WHERE scraped_at >= target_date AND scraped_at < target_date + 1;
+    
+    -- If no data for this day, skip
+    IF total_count = 0 THEN
+        RAISE NOTICE 'No data found for %', target_date;
+        RETURN FALSE;
+    END IF;
+    
+    -- Get most extreme headlines
+    SELECT headline, sentiment_compound 
+    INTO most_pos_headline, most_pos_score
+    FROM sentiment_analysis 
+    WHERE scraped_at >= target_date AND scraped_at < target_date + 1 
+    ORDER BY sentiment_compound DESC 
+    LIMIT 1;
+    
+    SELECT headline, sentiment_compound 
+    INTO most_neg_headline, most_neg_score
+    FROM sentiment_analysis 
+    WHERE scraped_at >= target_date AND scraped_at < target_date + 1 
+    ORDER BY sentiment_compound ASC 
+    LIMIT 1;
+    
+    -- Insert the summary
+    INSERT INTO daily_summaries (
+        date, total_headlines, positive_count, negative_count, neutral_count,
+        avg_sentiment, most_positive_headline, most_negative_headline,
+        most_positive_score, most_negative_score
+    ) VALUES (
+        target_date, total_count, pos_count, neg_count, neu_count,
+        avg_sent, most_pos_headline, most_neg_headline,
+        most_pos_score, most_neg_score
+    );
+    
+    RAISE NOTICE 'Generated daily summary for % with % headlines', target_date, total_count;
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,38 @@
+-- =================================================================
+-- Migration 004: Bulk insert RPC for sentiment results
+-- =================================================================
+-- Accepts a JSON array of rows and inserts them in one statement,
+-- skipping headlines that already exist. Returns the number inserted.
+
+CREATE OR REPLACE FUNCTION insert_sentiment(payload JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    inserted_count INTEGER;
+BEGIN
+    INSERT INTO sentiment_analysis (
+        headline, headline_hash, source, source_url, scraped_at,
+        sentiment_compound, sentiment_positive, sentiment_negative,
+        sentiment_neutral, classification
+    )
+    SELECT
+        x.headline, x.headline_hash, x.source, x.source_url, x.scraped_at,
+        x.sentiment_compound, x.sentiment_positive, x.sentiment_negative,
+        x.sentiment_neutral, x.classification
+    FROM jsonb_to_recordset(payload) AS x(
+        headline TEXT,
+        headline_hash TEXT,
+        source VARCHAR(50),
+        source_url TEXT,
+        scraped_at TIMESTAMPTZ,
+        sentiment_compound DECIMAL(6,4),
+        sentiment_positive DECIMAL(6,4),
+        sentiment_negative DECIMAL(6,4),
+        sentiment_neutral DECIMAL(6,4),
+        classification VARCHAR(10)
+    )
+    ON CONFLICT (headline_hash) DO NOTHING;
+    
+    GET DIAGNOSTICS inserted_count = ROW_COUNT;
+    RETURN inserted_count;
+END;
+$$ LANGUAGE plpgsql;
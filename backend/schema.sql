@@ -11,6 +11,7 @@ CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 CREATE TABLE sentiment_analysis (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     headline TEXT NOT NULL,
+    headline_hash TEXT NOT NULL,
     source VARCHAR(50) DEFAULT 'yahoo_finance',
     source_url TEXT,
     scraped_at TIMESTAMP WITH TIME ZONE NOT NULL,
@@ -47,6 +48,12 @@ CREATE TABLE daily_summaries (
 -- For time-based queries (most common)
 CREATE INDEX idx_sentiment_scraped_at ON sentiment_analysis(scraped_at DESC);
 
+-- For duplicate prevention (scraper upserts on this column)
+CREATE UNIQUE INDEX idx_sentiment_headline_hash ON sentiment_analysis(headline_hash);
+
+-- For time-bounded aggregates and extremes (range scan on scraped_at)
+CREATE INDEX idx_sentiment_scraped_at_compound ON sentiment_analysis(scraped_at, sentiment_compound);
+
 -- For classification filtering
 CREATE INDEX idx_sentiment_classification ON sentiment_analysis(classification);
 
@@ -153,6 +160,66 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Function to bulk insert scraped results, skipping duplicates (used by the backend)
+CREATE OR REPLACE FUNCTION insert_sentiment(payload JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    inserted_count INTEGER;
+BEGIN
+    INSERT INTO sentiment_analysis (
+        headline, headline_hash, source, source_url, scraped_at,
+        sentiment_compound, sentiment_positive, sentiment_negative,
+        sentiment_neutral, classification
+    )
+    SELECT
+        x.headline, x.headline_hash, x.source, x.source_url, x.scraped_at,
+        x.sentiment_compound, x.sentiment_positive, x.sentiment_negative,
+        x.sentiment_neutral, x.classification
+    FROM jsonb_to_recordset(payload) AS x(
+        headline TEXT,
+        headline_hash TEXT,
+        source VARCHAR(50),
+        source_url TEXT,
+        scraped_at TIMESTAMPTZ,
+        sentiment_compound DECIMAL(6,4),
+        sentiment_positive DECIMAL(6,4),
+        sentiment_negative DECIMAL(6,4),
+        sentiment_neutral DECIMAL(6,4),
+        classification VARCHAR(10)
+    )
+    ON CONFLICT (headline_hash) DO NOTHING;
+    
+    GET DIAGNOSTICS inserted_count = ROW_COUNT;
+    RETURN inserted_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function to aggregate sentiment over a time range (used by the backend)
+CREATE OR REPLACE FUNCTION sentiment_summary(start_time TIMESTAMPTZ, end_time TIMESTAMPTZ DEFAULT NOW())
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'total_headlines', COUNT(*),
+        'positive_count', COUNT(*) FILTER (WHERE classification = 'positive'),
+        'negative_count', COUNT(*) FILTER (WHERE classification = 'negative'),
+        'neutral_count', COUNT(*) FILTER (WHERE classification = 'neutral'),
+        'avg_sentiment', AVG(sentiment_compound),
+        'most_positive_headline', (
+            SELECT headline FROM sentiment_analysis
+            WHERE scraped_at >= start_time AND scraped_at <= end_time
+            ORDER BY sentiment_compound DESC LIMIT 1
+        ),
+        'most_positive_score', MAX(sentiment_compound),
+        'most_negative_headline', (
+            SELECT headline FROM sentiment_analysis
+            WHERE scraped_at >= start_time AND scraped_at <= end_time
+            ORDER BY sentiment_compound ASC LIMIT 1
+        ),
+        'most_negative_score', MIN(sentiment_compound)
+    )
+    FROM sentiment_analysis
+    WHERE scraped_at >= start_time AND scraped_at <= end_time;
+$$ LANGUAGE sql STABLE;
+
 -- Function to generate daily summary
 CREATE OR REPLACE FUNCTION generate_daily_summary(target_date DATE DEFAULT CURRENT_DATE)
 RETURNS BOOLEAN AS $$
@@ -185,7 +252,7 @@ BEGIN
         AVG(sentiment_compound)
     INTO total_count, pos_count, neg_count, neu_count, avg_sent
     FROM sentiment_analysis 
-    WHERE DATE(scraped_at) = target_date;
+    WHERE scraped_at >= target_date AND scraped_at < target_date + 1;
     
     -- If no data for this day, skip
     IF total_count = 0 THEN
@@ -197,14 +264,14 @@ BEGIN
     SELECT headline, sentiment_compound 
     INTO most_pos_headline, most_pos_score
     FROM sentiment_analysis 
-    WHERE DATE(scraped_at) = target_date 
+    WHERE scraped_at >= target_date AND scraped_at < target_date + 1 
     ORDER BY sentiment_compound DESC 
     LIMIT 1;
     
     SELECT headline, sentiment_compound 
     INTO most_neg_headline, most_neg_score
     FROM sentiment_analysis 
-    WHERE DATE(scraped_at) = target_date 
+    WHERE scraped_at >= target_date AND scraped_at < target_date + 1 
     ORDER BY sentiment_compound ASC 
     LIMIT 1;
     
@@ -261,6 +328,7 @@ GRANT ALL ON ALL SEQUENCES IN SCHEMA public TO service_role;
 -- Create a test record to verify setup
 INSERT INTO sentiment_analysis (
     headline, 
+    headline_hash, 
     source, 
     scraped_at, 
     sentiment_compound, 
@@ -270,6 +338,7 @@ INSERT INTO sentiment_analysis (
     classification
 ) VALUES (
     'Palantir Technologies reports strong quarterly results',
+    md5('Palantir Technologies reports strong quarterly results'),
     'test_data',
     NOW(),
     0.5,
@@ -1,13 +1,33 @@
+import asyncio
+import os
+import re
+import math
+import itertools
 import requests
-from bs4 import BeautifulSoup
+from requests_cache import CachedSession
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 import logging
 import time
 import random
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 from supabase_client import SupabaseClient
 
+# Prefer selectolax (Lexbor) for parsing; fall back to lxml with a
+# precompiled CSS selector when selectolax isn't installed
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+    from lxml import html as lxml_html
+    from lxml.cssselect import CSSSelector
+
 load_dotenv()
 
 logging.basicConfig(
@@ -16,11 +36,97 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+HEADLINE_SELECTOR = 'h3.clamp'
+
+# Single case-insensitive scan for Palantir-related keywords
+PALANTIR_KEYWORDS = ['palantir', 'pltr', 'karp', 'foundry', 'gotham', 'aip', 'ai']
+_PLTR_RE = re.compile(r'\b(?:' + '|'.join(PALANTIR_KEYWORDS) + r')\b', re.IGNORECASE)
+
+# Compile the CSS -> XPath translation once and reuse it for every scrape
+_HEADLINE_SEL = CSSSelector(HEADLINE_SELECTOR) if LexborHTMLParser is None else None
+
+# Shared analyzer so the VADER lexicon is only loaded once per process
+_ANALYZER = SentimentIntensityAnalyzer()
+
+# Memoized VADER scores keyed by headline text, kept in the parent process so
+# results scored by pool workers are cached too
+SCORE_CACHE_SIZE = 8192
+_SCORE_CACHE = OrderedDict()
+
+def _score_one(text):
+    """Score a single headline, returning None if VADER fails on it"""
+    try:
+        return _ANALYZER.polarity_scores(text)
+    except Exception as e:
+        logger.error(f"Error analyzing sentiment for headline: {text[:50]}... Error: {e}")
+        return None
+
+def _remember_scores(text, scores):
+    """Add scores to the LRU cache, evicting the oldest entry when full"""
+    _SCORE_CACHE[text] = scores
+    _SCORE_CACHE.move_to_end(text)
+    if len(_SCORE_CACHE) > SCORE_CACHE_SIZE:
+        _SCORE_CACHE.popitem(last=False)
+
+# Longest we'll sleep on a 429, whatever Retry-After says; keeps runs well
+# inside the workflow's 15 minute timeout
+MAX_RETRY_AFTER = 60
+
+# VADER costs ~90-110us per headline. On a 1-CPU runner a warm pool only breaks
+# even with inline scoring (64: 7.9ms vs 7.2ms, 2000: 190ms vs 213ms), so the
+# pool is only used with more than one core, and only for batches whose inline
+# cost (~45ms at 500) is in the range of the one-time worker startup
+POOL_MIN_HEADLINES = 500
+POOL_CHUNKSIZE = 32
+
+# Created on first use and reused for the rest of the process, so worker
+# startup is paid once rather than per analyze_sentiment call
+_POOL = None
+
+def _get_pool():
+    """Return the shared scoring pool, creating it on first use"""
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _POOL
+
 class PalantirSentimentAnalyzer:
     def __init__(self):
-        self.analyzer = SentimentIntensityAnalyzer()
+        self.analyzer = _ANALYZER
         self.supabase = SupabaseClient()
-        self.session = requests.Session()
+        # Conditional-GET cache (ETag/Last-Modified) so unchanged pages come
+        # back as 304s and skip parsing entirely
+        self.session = CachedSession(
+            'yahoo_cache',
+            backend='sqlite',
+            cache_control=True,
+            expire_after=300
+        )
+        
+        # Keep-alive pool plus automatic exponential backoff on 5xx; the final
+        # response is still returned so status handling below can log it. 429s
+        # are left to _scrape_url's single capped Retry-After wait, and urllib3's
+        # own Retry-After sleep is disabled because it has no upper bound
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=64,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=1.0,
+                status_forcelist=[500, 502, 503, 504],
+                respect_retry_after_header=False,
+                raise_on_status=False
+            )
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.5',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+        })
         
         # Rotate user agents to avoid detection
         self.user_agents = [
@@ -29,106 +135,179 @@ class PalantirSentimentAnalyzer:
             'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15'
         ]
+        # Common headers live on the session, so each request only overrides the UA.
+        # Start at a random offset so short runs don't always send the first one
+        start = random.randrange(len(self.user_agents))
+        rotated = self.user_agents[start:] + self.user_agents[:start]
+        self._header_cycle = itertools.cycle([{'User-Agent': ua} for ua in rotated])
     
     def get_random_headers(self):
-        """Get randomized headers to avoid detection"""
-        return {
-            'User-Agent': random.choice(self.user_agents),
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
+        """Get the next rotated User-Agent header (precomputed, round-robin)"""
+        return next(self._header_cycle)
+    
+    def _find_parent_link(self, element):
+        """Walk up the tree to the nearest enclosing <a> element"""
+        node = element.parent
+        while node is not None:
+            if node.tag == 'a':
+                return node
+            node = node.parent
+        return None
+    
+    def _extract_headline_elements(self, response):
+        """Parse a page response and return (text, href) pairs for headline elements"""
+        if LexborHTMLParser is not None:
+            # Lexbor needs the complete document, so parse the buffered body
+            tree = LexborHTMLParser(response.content)
+            extracted = []
+            for element in tree.css(HEADLINE_SELECTOR):
+                link_element = element.css_first('a') or self._find_parent_link(element)
+                href = link_element.attributes.get('href') if link_element else None
+                extracted.append((element.text().strip(), href))
+            return extracted
+        
+        if self.session.cache.contains(request=response.request):
+            # requests-cache already read the whole body in order to store it
+            tree = lxml_html.fromstring(response.content)
+        else:
+            # lxml feeds the stream to libxml2 in chunks instead of buffering it whole
+            response.raw.decode_content = True  # Undo gzip/deflate while reading
+            tree = lxml_html.parse(response.raw).getroot()
+        extracted = []
+        for element in _HEADLINE_SEL(tree):
+            # Prefer a link inside the headline, otherwise the nearest enclosing one
+            hrefs = element.xpath('.//a/@href') or element.xpath('ancestor::a/@href')[-1:]
+            extracted.append((element.text_content().strip(), hrefs[0] if hrefs else None))
+        return extracted
+    
+    def _rate_limit_delay(self, response, default=5):
+        """Seconds to wait after a 429: Retry-After plus up to 50% jitter, capped at MAX_RETRY_AFTER"""
+        retry_after = response.headers.get('Retry-After')
+        delay = None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                # Retry-After may also be an HTTP date
+                try:
+                    delay = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+                except (TypeError, ValueError):
+                    pass
+        if delay is None or not math.isfinite(delay):
+            delay = default
+        delay = min(max(delay, 0), MAX_RETRY_AFTER)
+        return min(delay + random.uniform(0, delay * 0.5), MAX_RETRY_AFTER)
+    
+    def _scrape_url(self, url):
+        """Fetch a single page and return the Palantir headlines found on it,
+        or None if the page is unchanged since the last scrape"""
+        response = None
+        try:
+            logger.info(f"Scraping {url}")
+            
+            headers = self.get_random_headers()
+            logger.info(f"🌐 Using headers: {headers['User-Agent'][:50]}...")
+            
+            # Stream so the lxml fallback can parse straight off the socket
+            response = self.session.get(url, headers=headers, timeout=30, stream=True)
+            
+            if response.status_code == 429:
+                # The adapter doesn't retry 429s; make one more attempt after
+                # the advertised Retry-After plus jitter (capped)
+                delay = self._rate_limit_delay(response)
+                logger.warning(f"⚠️ Rate limited by {url}. Retrying in {delay:.1f}s...")
+                response.close()
+                time.sleep(delay)
+                response = self.session.get(url, headers=headers, timeout=30, stream=True)
+            
+            # Debug response details
+            logger.info(f"📡 Response Status: {response.status_code}")
+            logger.info(f"📡 Response Headers: {dict(list(response.headers.items())[:5])}")
+            logger.info(f"📡 Response URL: {response.url}")
+            logger.info(f"📡 Content Length: {response.headers.get('Content-Length', 'unknown')} bytes")
+            
+            if response.url != url:
+                logger.warning(f"🔄 Redirected from {url} to {response.url}")
+            
+            if getattr(response, 'from_cache', False):
+                logger.info(f"♻️ {url} unchanged since last scrape, skipping parse")
+                return None
+            
+            if response.status_code == 429:
+                logger.warning(f"⚠️ Still rate limited by {url}. Skipping...")
+                return []
+            elif response.status_code == 403:
+                logger.warning(f"⚠️ Access forbidden for {url}. Trying next URL...")
+                return []
+            elif response.status_code != 200:
+                logger.warning(f"⚠️ Unexpected status code {response.status_code} for {url}")
+                return []
+            
+            elements = self._extract_headline_elements(response)
+            logger.info(f"🎯 Selector '{HEADLINE_SELECTOR}' found {len(elements)} elements")
+            headlines_found = []
+            
+            # Every headline on the page shares one scrape timestamp
+            scraped_at = datetime.now(timezone.utc).isoformat()
+            
+            for text, href in elements:
+                if text and len(text) > 10:  # Filter out very short text
+                    # Check if it's Palantir-related
+                    if _PLTR_RE.search(text):
+                        logger.info(f"   ✅ PALANTIR MATCH: {text}")
+                        
+                        source_url = href or url
+                        logger.info(f"   🔗 Source URL: {source_url}")
+                        
+                        headline = {
+                            'text': text,
+                            'timestamp': scraped_at,
+                            'source': 'Yahoo Finance',
+                            'source_url': source_url
+                        }
+                        headlines_found.append(headline)
+            
+            logger.info(f"Found {len(headlines_found)} headlines from {url}")
+            return headlines_found
+            
+        except requests.RequestException as e:
+            logger.error(f"Request error for {url}: {e}")
+            return []
+        except Exception as e:
+            logger.error(f"Unexpected error scraping {url}: {e}")
+            return []
+        finally:
+            if response is not None:
+                response.close()
+    
+    async def _scrape_urls(self, urls):
+        """Fetch all URLs concurrently, sharing the pooled session across threads"""
+        return await asyncio.gather(*(asyncio.to_thread(self._scrape_url, url) for url in urls))
     
     def scrape_yahoo_headlines(self):
-        """Scrape Palantir headlines from Yahoo Finance"""
+        """Scrape Palantir headlines from Yahoo Finance; returns None when
+        every page is unchanged since the last scrape"""
         urls = [
             'https://finance.yahoo.com/quote/PLTR/',
         ]
         
-        all_headlines = []
+        # A single page needs no event loop or worker thread
+        if len(urls) == 1:
+            pages = [self._scrape_url(urls[0])]
+        else:
+            pages = asyncio.run(self._scrape_urls(urls))
         
-        for url in urls:
-            try:
-                logger.info(f"Scraping {url}")
-                
-                headers = self.get_random_headers()
-                logger.info(f"🌐 Using headers: {headers['User-Agent'][:50]}...")
-                
-                response = self.session.get(url, headers=headers, timeout=30)
-                
-                # Debug response details
-                logger.info(f"📡 Response Status: {response.status_code}")
-                logger.info(f"📡 Response Headers: {dict(list(response.headers.items())[:5])}")
-                logger.info(f"📡 Response URL: {response.url}")
-                logger.info(f"📡 Content Length: {len(response.content)} bytes")
-                
-                if response.url != url:
-                    logger.warning(f"🔄 Redirected from {url} to {response.url}")
-                
-                if response.status_code == 429:
-                    logger.warning(f"⚠️ Rate limited by {url}. Waiting longer...")
-                    time.sleep(30)  # Wait 30 seconds if rate limited
-                    continue
-                elif response.status_code == 403:
-                    logger.warning(f"⚠️ Access forbidden for {url}. Trying next URL...")
-                    continue
-                elif response.status_code != 200:
-                    logger.warning(f"⚠️ Unexpected status code {response.status_code} for {url}")
-                    continue
-                
-                soup = BeautifulSoup(response.content, 'html.parser')
-                headlines_found = []
-
-                selectors = [
-                    'h3.clamp',
-                ]
-                
-                for selector in selectors:
-                    try:
-                        elements = soup.select(selector)
-                        logger.info(f"🎯 Selector '{selector}' found {len(elements)} elements")
-                        
-                        for element in elements:
-                            text = element.get_text().strip()
-                            if text and len(text) > 10:  # Filter out very short text
-                                # Check if it's Palantir-related
-                                text_lower = text.lower()
-                                if any(keyword in text_lower for keyword in ['palantir', 'pltr', 'karp', 'foundry', 'gotham', 'aip', 'ai']):
-                                    logger.info(f"   ✅ PALANTIR MATCH: {text}")
-                                    
-                                    # Try to get the link
-                                    link_element = element.find('a') or element.find_parent('a')
-                                    source_url = link_element.get('href') if link_element else url
-                                    logger.info(f"   🔗 Source URL: {source_url}")
-                                    
-                                    headline = {
-                                        'text': text,
-                                        'timestamp': datetime.now().isoformat(),
-                                        'source': 'Yahoo Finance',
-                                        'source_url': source_url
-                                    }
-                                    headlines_found.append(headline)
-                    except Exception as selector_error:
-                        logger.debug(f"Selector {selector} failed: {selector_error}")
-                        continue
-                
-                all_headlines.extend(headlines_found)
-                logger.info(f"Found {len(headlines_found)} headlines from {url}")
-                
-            except requests.RequestException as e:
-                logger.error(f"Request error for {url}: {e}")
-                continue
-            except Exception as e:
-                logger.error(f"Unexpected error scraping {url}: {e}")
-                continue
-        
-        # Remove duplicates based on headline text
+        # Remove duplicates based on headline text as pages are merged
         seen = set()
         unique_headlines = []
-        for headline in all_headlines:
-            if headline['text'] not in seen:
+        
+        if all(headlines_found is None for headlines_found in pages):
+            return None
+        
+        for headlines_found in pages:
+            for headline in headlines_found or []:
+                if headline['text'] in seen:
+                    continue
                 seen.add(headline['text'])
                 unique_headlines.append(headline)
         
@@ -137,32 +316,47 @@ class PalantirSentimentAnalyzer:
     
     def analyze_sentiment(self, headlines):
         """Run VADER sentiment analysis on headlines"""
-        results = []
+        texts = [headline['text'] for headline in headlines]
         
-        for headline in headlines:
-            try:
-                # Get VADER sentiment scores
-                sentiment = self.analyzer.polarity_scores(headline['text'])
-                
-                # Classify sentiment based on compound score
-                if sentiment['compound'] >= 0.05:
-                    classification = 'positive'
-                elif sentiment['compound'] <= -0.05:
-                    classification = 'negative'
-                else:
-                    classification = 'neutral'
-                
-                result = {
-                    **headline,
-                    'sentiment_scores': sentiment,
-                    'classification': classification
-                }
-                results.append(result)
-                logger.info(f"✅ Analyzed sentiment for headline: {headline['text'][:50]}... Sentiment: {classification}")
-                
-            except Exception as e:
-                logger.error(f"Error analyzing sentiment for headline: {headline['text'][:50]}... Error: {e}")
-                continue
+        scores_by_text = {}
+        for text in texts:
+            if text in _SCORE_CACHE:
+                _SCORE_CACHE.move_to_end(text)
+                scores_by_text[text] = _SCORE_CACHE[text]
+        missing = list(dict.fromkeys(text for text in texts if text not in scores_by_text))
+        
+        # Scoring is pure-Python and independent per headline, so spread large
+        # batches across cores; each worker reuses its own module-level analyzer
+        if len(missing) >= POOL_MIN_HEADLINES and (os.cpu_count() or 1) > 1:
+            fresh = _get_pool().map(_score_one, missing, chunksize=POOL_CHUNKSIZE)
+        else:
+            fresh = map(_score_one, missing)
+        
+        for text, sentiment in zip(missing, fresh):
+            if sentiment is not None:
+                scores_by_text[text] = sentiment
+                _remember_scores(text, sentiment)
+        
+        # Copy so results never share (or mutate) the cached dicts
+        raw_scores = [dict(scores_by_text[text]) if text in scores_by_text else None for text in texts]
+        
+        scored = [(headline, sentiment) for headline, sentiment in zip(headlines, raw_scores) if sentiment is not None]
+        
+        # Classify all compound scores branchlessly in one vectorized pass
+        compound = np.fromiter((sentiment['compound'] for _, sentiment in scored), dtype=np.float64, count=len(scored))
+        classifications = np.select(
+            [compound >= 0.05, compound <= -0.05],
+            ['positive', 'negative'],
+            default='neutral'
+        ).tolist()
+        
+        results = [
+            {**headline, 'sentiment_scores': sentiment, 'classification': classification}
+            for (headline, sentiment), classification in zip(scored, classifications)
+        ]
+        
+        for result in results:
+            logger.info(f"✅ Analyzed sentiment for headline: {result['text'][:50]}... Sentiment: {result['classification']}")
         
         return results
     
@@ -173,6 +367,11 @@ class PalantirSentimentAnalyzer:
             
             # Scrape headlines
             headlines = self.scrape_yahoo_headlines()
+            if headlines is None:
+                # Nothing new was published; the summary may still be due
+                logger.info("Yahoo Finance unchanged since last run, nothing new to analyze")
+                self.supabase.create_daily_summary()
+                return
             if not headlines:
                 logger.warning("No headlines found, skipping analysis")
                 return
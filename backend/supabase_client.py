@@ -1,6 +1,7 @@
 import os
+import hashlib
 from supabase import create_client
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, timedelta, timezone
 import logging
 from typing import List, Dict, Optional
 
@@ -24,26 +25,21 @@ class SupabaseClient:
             return 0
         
         try:
-            # Prepare data for insertion
+            # Prepare data for insertion; duplicates are rejected by the
+            # unique headline_hash index, so no pre-select is needed
             rows = []
-            skipped_count = 0
+            seen = set()
             
             for result in results:
-                # Check if headline already exists to avoid duplicates
-                # Extended time window to 7 days to catch more duplicates
-                existing = self.client.table('sentiment_analysis')\
-                    .select('id, scraped_at')\
-                    .eq('headline', result['text'])\
-                    .gte('scraped_at', (datetime.now() - timedelta(days=7)).isoformat())\
-                    .execute()
-                
-                if existing.data:
-                    skipped_count += 1
-                    logger.debug(f"Skipping duplicate headline (last seen: {existing.data[0]['scraped_at']}): {result['text'][:50]}...")
+                headline = result['text'][:1000]  # Truncate if too long
+                headline_hash = hashlib.md5(headline.encode()).hexdigest()
+                if headline_hash in seen:
                     continue
+                seen.add(headline_hash)
                 
                 row = {
-                    'headline': result['text'][:1000],  # Truncate if too long
+                    'headline': headline,
+                    'headline_hash': headline_hash,
                     'source': result.get('source', 'yahoo_finance'),
                     'source_url': result.get('source_url', ''),
                     'scraped_at': result['timestamp'],
@@ -55,26 +51,20 @@ class SupabaseClient:
                 }
                 rows.append(row)
             
-            logger.info(f"Processed {len(results)} headlines: {len(rows)} new, {skipped_count} duplicates")
-            
-            if not rows:
-                logger.info("All headlines were duplicates, nothing to save")
-                return 0
-            
-            # Insert data in batches of 100 with error handling for constraints
-            batch_size = 100
+            # Insert server-side in one RPC per 1000 rows (~200 bytes each);
+            # duplicates are skipped by ON CONFLICT (headline_hash) DO NOTHING
+            batch_size = 1000
             total_inserted = 0
             
             for i in range(0, len(rows), batch_size):
                 batch = rows[i:i + batch_size]
-                response = self.client.table('sentiment_analysis').insert(batch).execute()
+                response = self.client.rpc('insert_sentiment', {'payload': batch}).execute()
                 
-                if response.data:
-                    total_inserted += len(response.data)
-                    logger.info(f"Inserted batch {i//batch_size + 1}: {len(response.data)} records")
-                else:
-                    logger.error(f"Failed to insert batch {i//batch_size + 1}")
+                inserted = response.data or 0
+                total_inserted += inserted
+                logger.info(f"Inserted batch {i//batch_size + 1}: {inserted} new records")
             
+            logger.info(f"Processed {len(results)} headlines: {total_inserted} new, {len(results) - total_inserted} duplicates")
             logger.info(f"Successfully saved {total_inserted} new records to Supabase")
             return total_inserted
             
@@ -85,7 +75,7 @@ class SupabaseClient:
     def get_recent_data(self, hours: int = 24) -> List[Dict]:
         """Get recent sentiment data from Supabase"""
         try:
-            start_time = (datetime.now() - timedelta(hours=hours)).isoformat()
+            start_time = (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
             
             response = self.client.table('sentiment_analysis')\
                 .select('*')\
@@ -99,28 +89,38 @@ class SupabaseClient:
             logger.error(f"Error getting recent data: {e}")
             return []
     
+    def _get_sentiment_stats(self, start_time: datetime, end_time: datetime) -> Optional[Dict]:
+        """Aggregate sentiment between two timestamps in Postgres (see sentiment_summary)"""
+        response = self.client.rpc('sentiment_summary', {
+            'start_time': start_time.isoformat(),
+            'end_time': end_time.isoformat()
+        }).execute()
+        
+        stats = response.data
+        if not stats or not stats.get('total_headlines'):
+            return None
+        
+        for key in ('avg_sentiment', 'most_positive_score', 'most_negative_score'):
+            stats[key] = float(stats[key])
+        return stats
+    
     def get_latest_summary(self, hours: int = 5) -> Dict:
         """Get summary of sentiment data from last N hours"""
         try:
-            data = self.get_recent_data(hours)
+            end_time = datetime.now(timezone.utc)
+            start_time = end_time - timedelta(hours=hours)
+            stats = self._get_sentiment_stats(start_time, end_time)
             
-            if not data:
+            if not stats:
                 return {'error': 'No recent data found'}
             
-            # Calculate summary statistics
-            total = len(data)
-            positive = sum(1 for r in data if r['classification'] == 'positive')
-            negative = sum(1 for r in data if r['classification'] == 'negative')
-            neutral = total - positive - negative
-            
-            avg_sentiment = sum(r['sentiment_compound'] for r in data) / total
-            
-            # Find most extreme headlines
-            most_positive = max(data, key=lambda x: x['sentiment_compound'])
-            most_negative = min(data, key=lambda x: x['sentiment_compound'])
+            total = stats['total_headlines']
+            positive = stats['positive_count']
+            negative = stats['negative_count']
+            neutral = stats['neutral_count']
             
             return {
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': datetime.now(timezone.utc).isoformat(),
                 'period_hours': hours,
                 'total_headlines': total,
                 'sentiment_distribution': {
@@ -133,11 +133,11 @@ class SupabaseClient:
                     'negative': round(negative/total*100, 1),
                     'neutral': round(neutral/total*100, 1)
                 },
-                'average_sentiment': round(avg_sentiment, 4),
-                'most_positive_headline': most_positive['headline'],
-                'most_negative_headline': most_negative['headline'],
-                'most_positive_score': round(most_positive['sentiment_compound'], 4),
-                'most_negative_score': round(most_negative['sentiment_compound'], 4)
+                'average_sentiment': round(stats['avg_sentiment'], 4),
+                'most_positive_headline': stats['most_positive_headline'],
+                'most_negative_headline': stats['most_negative_headline'],
+                'most_positive_score': round(stats['most_positive_score'], 4),
+                'most_negative_score': round(stats['most_negative_score'], 4)
             }
             
         except Exception as e:
@@ -147,7 +147,7 @@ class SupabaseClient:
     def create_daily_summary(self, target_date: Optional[date] = None) -> Optional[Dict]:
         """Create and save daily summary"""
         if target_date is None:
-            target_date = date.today()
+            target_date = datetime.now(timezone.utc).date()
         
         try:
             # Check if summary already exists for this date
@@ -160,43 +160,27 @@ class SupabaseClient:
                 logger.info(f"Daily summary for {target_date} already exists")
                 return None
             
-            # Get all data for the day
-            start_time = datetime.combine(target_date, datetime.min.time())
-            end_time = datetime.combine(target_date, datetime.max.time())
-            
-            response = self.client.table('sentiment_analysis')\
-                .select('*')\
-                .gte('scraped_at', start_time.isoformat())\
-                .lte('scraped_at', end_time.isoformat())\
-                .execute()
+            # Aggregate the day's data server-side
+            start_time = datetime.combine(target_date, datetime.min.time(), tzinfo=timezone.utc)
+            end_time = datetime.combine(target_date, datetime.max.time(), tzinfo=timezone.utc)
             
-            data = response.data
+            stats = self._get_sentiment_stats(start_time, end_time)
             
-            if not data:
+            if not stats:
                 logger.info(f"No data found for {target_date}")
                 return None
             
-            # Calculate daily summary
-            total = len(data)
-            positive = sum(1 for r in data if r['classification'] == 'positive')
-            negative = sum(1 for r in data if r['classification'] == 'negative')
-            neutral = total - positive - negative
-            
-            avg_sentiment = sum(r['sentiment_compound'] for r in data) / total
-            most_positive = max(data, key=lambda x: x['sentiment_compound'])
-            most_negative = min(data, key=lambda x: x['sentiment_compound'])
-            
             summary = {
                 'date': target_date.isoformat(),
-                'total_headlines': total,
-                'positive_count': positive,
-                'negative_count': negative,
-                'neutral_count': neutral,
-                'avg_sentiment': round(avg_sentiment, 4),
-                'most_positive_headline': most_positive['headline'][:500],  # Truncate
-                'most_negative_headline': most_negative['headline'][:500],
-                'most_positive_score': round(most_positive['sentiment_compound'], 4),
-                'most_negative_score': round(most_negative['sentiment_compound'], 4)
+                'total_headlines': stats['total_headlines'],
+                'positive_count': stats['positive_count'],
+                'negative_count': stats['negative_count'],
+                'neutral_count': stats['neutral_count'],
+                'avg_sentiment': round(stats['avg_sentiment'], 4),
+                'most_positive_headline': stats['most_positive_headline'][:500],  # Truncate
+                'most_negative_headline': stats['most_negative_headline'][:500],
+                'most_positive_score': round(stats['most_positive_score'], 4),
+                'most_negative_score': round(stats['most_negative_score'], 4)
             }
             
             # Save summary
@@ -216,7 +200,7 @@ class SupabaseClient:
     def get_daily_summaries(self, days: int = 7) -> List[Dict]:
         """Get daily summaries for the last N days"""
         try:
-            start_date = (date.today() - timedelta(days=days)).isoformat()
+            start_date = (datetime.now(timezone.utc).date() - timedelta(days=days)).isoformat()
             
             response = self.client.table('daily_summaries')\
                 .select('*')\
@@ -233,7 +217,7 @@ class SupabaseClient:
     def cleanup_old_data(self, days: int = 30):
         """Remove old data to keep database size reasonable"""
         try:
-            cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
+            cutoff_date = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
             
             # Delete old sentiment analysis records
             response = self.client.table('sentiment_analysis')\
@@ -244,7 +228,7 @@ class SupabaseClient:
             logger.info(f"Cleaned up old sentiment data older than {days} days")
             
             # Keep daily summaries for longer (90 days)
-            summary_cutoff = (date.today() - timedelta(days=90)).isoformat()
+            summary_cutoff = (datetime.now(timezone.utc).date() - timedelta(days=90)).isoformat()
             self.client.table('daily_summaries')\
                 .delete()\
                 .lt('date', summary_cutoff)\
@@ -258,20 +242,30 @@ class SupabaseClient:
     def get_health_status(self) -> Dict:
         """Get database health status"""
         try:
-            # Check recent data
-            recent_data = self.get_recent_data(hours=24)
-            last_update = None
+            # Latest scrape and 24h volume via indexed queries instead of
+            # pulling every recent row
+            latest = self.client.table('sentiment_analysis')\
+                .select('scraped_at')\
+                .order('scraped_at', desc=True)\
+                .limit(1)\
+                .execute()
+            last_update = latest.data[0]['scraped_at'] if latest.data else None
             
-            if recent_data:
-                last_update = max(recent_data, key=lambda x: x['scraped_at'])['scraped_at']
+            recent_count = self.client.table('sentiment_analysis')\
+                .select('id', count='exact')\
+                .gte('scraped_at', (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat())\
+                .limit(1)\
+                .execute()
             
-            # Get table counts
+            # Get table counts (the exact count comes back in the response header)
             sentiment_count = self.client.table('sentiment_analysis')\
                 .select('id', count='exact')\
+                .limit(1)\
                 .execute()
             
             summary_count = self.client.table('daily_summaries')\
                 .select('id', count='exact')\
+                .limit(1)\
                 .execute()
             
             return {
@@ -279,8 +273,8 @@ class SupabaseClient:
                 'last_update': last_update,
                 'total_headlines': sentiment_count.count if sentiment_count.count else 0,
                 'daily_summaries': summary_count.count if summary_count.count else 0,
-                'recent_headlines_24h': len(recent_data),
-                'timestamp': datetime.now().isoformat()
+                'recent_headlines_24h': recent_count.count if recent_count.count else 0,
+                'timestamp': datetime.now(timezone.utc).isoformat()
             }
             
         except Exception as e:
@@ -288,5 +282,5 @@ class SupabaseClient:
             return {
                 'status': 'error',
                 'error': str(e),
-                'timestamp': datetime.now().isoformat()
+                'timestamp': datetime.now(timezone.utc).isoformat()
             } 
\ No newline at end of file